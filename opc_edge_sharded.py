@@ -0,0 +1,447 @@
+import argparse
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import time
+
+from asyncua import ua
+from asyncua.common.methods import uamethod
+
+from opc_edge_ver2 import (
+    CLIENT_SECURITY,
+    Alarm,
+    EdgeServer,
+    SensorClient,
+    TempMonitor,
+    check_thresholds,
+    compute_analytics,
+    decode_update,
+)
+from opc_session import SessionPool
+from opc_tsensor_fleet import BASE_PORT, HOST, REPORT_INTERVAL, sensor_endpoint
+from packed_array import PlainArrays, unpack_array
+from sample_recorder import SampleRecorder
+
+_logger = logging.getLogger(__name__)
+
+# Sharding settings
+SENSOR_TYPE_PATH = ["0:Types", "0:ObjectTypes", "0:BaseObjectType", "2:temp_sensor"]
+READY_TIMEOUT = 30.0  # seconds for all workers to attach their sensors
+CALL_TIMEOUT = 5.0  # seconds for a forwarded method call
+# spawned workers inherit no other pipe ends, so either side sees EOF on exit
+WORKER_CONTEXT = multiprocessing.get_context("spawn")
+
+# Messages exchanged over each worker pipe:
+#   worker -> front  ("ready", suffix, data, state, threshold_high, threshold_low)
+#                    ("data", suffix, packed samples, analytics, alarm message)
+#                    ("result", call_id, result)
+#   front -> worker  ("write", suffix, "config" | "state", value)
+#                    ("call", call_id, suffix, "analyze", data)
+#                    ("stop",)
+
+
+async def receive_message(conn):
+    """Wait for the next message on a pipe without holding an executor thread.
+
+    Raises EOFError once the other end has closed.
+    """
+    loop = asyncio.get_running_loop()
+    while not conn.poll():
+        readable = loop.create_future()
+        loop.add_reader(
+            conn.fileno(), lambda: readable.done() or readable.set_result(None)
+        )
+        try:
+            await readable
+        finally:
+            loop.remove_reader(conn.fileno())
+    return conn.recv()
+
+
+def parse_write(field, value):
+    """Return the value of a forwarded client write, or None if it is malformed"""
+    if field == "config":
+        try:
+            threshold_high, threshold_low = (float(v) for v in value)
+        except (TypeError, ValueError):
+            return None
+        return [threshold_high, threshold_low]
+    if field == "state" and isinstance(value, str):
+        return value
+    return None
+
+
+class MonitorShard:
+    """Worker-side state of one sensor_monitor"""
+
+    def __init__(self, conn, suffix, threshold_high, threshold_low, state, recorder):
+        self.conn = conn
+        self.suffix = suffix
+        self.threshold_high = threshold_high
+        self.threshold_low = threshold_low
+        self.state = state
+        self.recorder = recorder
+
+    def datachange_notification(self, node, val, data):
+        update = decode_update(val)
+        if update is None:
+            return
+        blob, samples = update
+        if self.recorder is not None:
+            self.recorder.record(time.time(), samples)
+        message = check_thresholds(samples, self.threshold_high, self.threshold_low)
+        analytics = compute_analytics(samples)
+        try:
+            self.conn.send(("data", self.suffix, blob, analytics, message))
+        except OSError:
+            pass  # front is gone, run() stops the worker
+
+    def event_notification(self, event):
+        pass
+
+
+class ShardWorker:
+    """Owns a subset of sensors: subscriptions, threshold checks, analytics and recording"""
+
+    def __init__(self, conn, sensors, security, recording):
+        self.conn = conn
+        self.sensors = sensors  # suffix -> sensor url
+        self.security = security
+        self.recording = recording
+        self.monitors = {}
+
+    async def attach(self, suffix, url):
+        session = await SessionPool.get(url, self.security)
+        temp_sensor = await session.get_child(
+            SENSOR_TYPE_PATH + [f"2:temp_sensor_{suffix}"]
+        )
+        data = await temp_sensor.get_child(["2:data"])
+        data_value = await data.read_value()
+        state_value = await (await temp_sensor.get_child(["2:status"])).read_value()
+        threshold_high_value = await (
+            await temp_sensor.get_child(["2:threshold_high"])
+        ).read_value()
+        threshold_low_value = await (
+            await temp_sensor.get_child(["2:threshold_low"])
+        ).read_value()
+        recorder = SampleRecorder(f"temp_sm_{suffix}") if self.recording else None
+        monitor = MonitorShard(
+            self.conn,
+            suffix,
+            threshold_high_value,
+            threshold_low_value,
+            state_value,
+            recorder,
+        )
+        self.monitors[suffix] = monitor
+        self.conn.send(
+            (
+                "ready",
+                suffix,
+                data_value,
+                state_value,
+                threshold_high_value,
+                threshold_low_value,
+            )
+        )
+        data_packed = await SensorClient.find_packed_data(temp_sensor)
+        sub = await session.create_subscription(50, monitor)
+        await sub.subscribe_data_change(data if data_packed is None else data_packed)
+
+    def handle(self, message):
+        if message[0] == "write":
+            _, suffix, field, value = message
+            monitor = self.monitors.get(suffix)
+            value = parse_write(field, value)
+            if monitor is None or value is None:
+                _logger.warning("dropped %s write to temp_sm_%s", field, suffix)
+            elif field == "config":
+                monitor.threshold_high, monitor.threshold_low = value
+            elif field == "state":
+                monitor.state = value
+        elif message[0] == "call":
+            _, call_id, suffix, method, data = message
+            analytics = compute_analytics(data)
+            result = (analytics["mean"], analytics["stdev"]) if analytics else (0, 0)
+            self.conn.send(("result", call_id, result))
+
+    async def run(self):
+        for suffix, url in self.sensors.items():
+            await self.attach(suffix, url)
+        try:
+            while True:
+                try:
+                    message = await receive_message(self.conn)
+                except (EOFError, OSError):
+                    _logger.warning("front server is gone, stopping")
+                    break
+                if message[0] == "stop":
+                    break
+                self.handle(message)
+        finally:
+            for monitor in self.monitors.values():
+                if monitor.recorder is not None:
+                    monitor.recorder.close()
+            await SessionPool.close_all()
+
+
+def run_worker(conn, sensors, security, recording):
+    """Process entry point of one shard"""
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("asyncua").setLevel(logging.WARNING)
+    asyncio.run(ShardWorker(conn, sensors, security, recording).run())
+
+
+class WriteForwarder(object):
+    """Front-side subscription that forwards client writes to the owning worker"""
+
+    def __init__(self):
+        self.targets = {}  # nodeid -> (conn, suffix, field)
+
+    def datachange_notification(self, node, val, data):
+        conn, suffix, field = self.targets[node.nodeid]
+        value = parse_write(field, val)
+        if value is None:
+            _logger.warning("dropped %s write to temp_sm_%s: %r", field, suffix, val)
+            return
+        try:
+            conn.send(("write", suffix, field, value))
+        except OSError:
+            _logger.warning("worker of temp_sm_%s is gone, write dropped", suffix)
+
+    def event_notification(self, event):
+        pass
+
+
+class ShardedEdge:
+    """Front server exposing one address space for all shards"""
+
+    def __init__(self, sensors, workers, security=CLIENT_SECURITY, recording=True):
+        self.sensors = sensors  # suffix -> sensor url
+        self.workers = workers
+        self.security = security
+        self.recording = recording
+        self.conns = {}  # suffix -> worker pipe
+        self.lost = set()  # pipes of workers that exited
+        self.processes = []
+        self.monitors = {}  # suffix -> front nodes
+        self.pending_calls = {}
+        self.call_ids = itertools.count()
+        self.alarm = None
+        self.plain = None
+        self.published = 0
+
+    def start_workers(self):
+        shards = [{} for _ in range(self.workers)]
+        for i, (suffix, url) in enumerate(self.sensors.items()):
+            shards[i % self.workers][suffix] = url
+        for shard in shards:
+            if not shard:
+                continue
+            conn, worker_conn = WORKER_CONTEXT.Pipe()
+            process = WORKER_CONTEXT.Process(
+                target=run_worker,
+                args=(worker_conn, shard, self.security, self.recording),
+                daemon=True,
+            )
+            process.start()
+            worker_conn.close()
+            self.processes.append(process)
+            for suffix in shard:
+                self.conns[suffix] = conn
+        _logger.info(
+            "started %d workers for %d sensors", len(self.processes), len(self.sensors)
+        )
+
+    async def wait_ready(self):
+        ready = {}
+
+        async def attached(conn, suffixes):
+            while not suffixes <= ready.keys():
+                try:
+                    message = await receive_message(conn)
+                except (EOFError, OSError):
+                    missing = ", ".join(sorted(suffixes - ready.keys()))
+                    raise RuntimeError(
+                        f"worker exited before attaching sensors {missing}"
+                    ) from None
+                if message[0] == "ready":
+                    ready[message[1]] = message[2:]
+
+        shards = {}  # worker pipe -> suffixes it attaches
+        for suffix, conn in self.conns.items():
+            shards.setdefault(conn, set()).add(suffix)
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*[attached(c, s) for c, s in shards.items()]),
+                READY_TIMEOUT,
+            )
+        except asyncio.TimeoutError:
+            missing = ", ".join(sorted(set(self.sensors) - ready.keys()))
+            raise TimeoutError(f"workers did not attach sensors {missing}") from None
+        return ready
+
+    def forward_analyze(self, suffix):
+        @uamethod
+        async def analyze(parent, data):
+            conn = self.conns[suffix]
+            if conn in self.lost:
+                return ua.StatusCode(ua.StatusCodes.BadCommunicationError)
+            call_id = next(self.call_ids)
+            future = asyncio.get_running_loop().create_future()
+            self.pending_calls[call_id] = future
+            try:
+                conn.send(("call", call_id, suffix, "analyze", list(data)))
+                return await asyncio.wait_for(future, CALL_TIMEOUT)
+            except OSError:
+                return ua.StatusCode(ua.StatusCodes.BadCommunicationError)
+            finally:
+                self.pending_calls.pop(call_id, None)
+
+        return analyze
+
+    async def build(self, server, idx, ready):
+        sensor_monitor_type = await EdgeServer.create_sensor_monitor_type(server, idx)
+        self.plain = PlainArrays(server)
+        forwarder = WriteForwarder()
+        for suffix, (data, state, high, low) in sorted(ready.items()):
+            (
+                _,
+                tsm_data,
+                tsm_state,
+                tsm_config,
+                _,
+                _,
+                tsm_stats,
+                tsm_data_packed,
+            ) = await TempMonitor.instantiate_temp_monitor(
+                idx,
+                server,
+                sensor_monitor_type,
+                data,
+                state,
+                high,
+                low,
+                suffix,
+                self.forward_analyze(suffix),
+            )
+            self.monitors[suffix] = (tsm_data, tsm_data_packed, tsm_stats, tsm_config)
+            self.plain.add(tsm_data)
+            forwarder.targets[tsm_config.nodeid] = (
+                self.conns[suffix],
+                suffix,
+                "config",
+            )
+            forwarder.targets[tsm_state.nodeid] = (self.conns[suffix], suffix, "state")
+        await TempMonitor.add_batch_method(
+            server,
+            idx,
+            {
+                f"temp_sm_{suffix}": (tsm_data_packed, tsm_config)
+                for suffix, (_, tsm_data_packed, _, tsm_config) in self.monitors.items()
+            },
+        )
+        sub = await server.create_subscription(50, forwarder)
+        await sub.subscribe_data_change(
+            [server.get_node(nodeid) for nodeid in forwarder.targets]
+        )
+
+    async def publish(self, suffix, blob, analytics, message):
+        tsm_data, tsm_data_packed, tsm_stats, _ = self.monitors[suffix]
+        await tsm_data_packed.write_value(ua.Variant(blob, ua.VariantType.ByteString))
+        # the plain array is only decoded for clients that read or monitor it
+        await self.plain.update(tsm_data, unpack_array(blob))
+        await TempMonitor.write_analytics(tsm_stats, analytics)
+        self.published += 1
+        if message is not None:
+            await self.alarm.trigger(message=f"temp_sm_{suffix}: {message}")
+            _logger.warning("temp_sm_%s: %s", suffix, message)
+
+    async def receive(self, conn):
+        while True:
+            try:
+                message = await receive_message(conn)
+            except (EOFError, OSError):
+                # the other shards keep running; this one's monitors go stale
+                self.lost.add(conn)
+                suffixes = sorted(s for s, c in self.conns.items() if c is conn)
+                _logger.error("worker of sensors %s exited", ", ".join(suffixes))
+                return
+            if message[0] == "data" and message[1] in self.monitors:
+                await self.publish(*message[1:])
+            elif message[0] == "result":
+                future = self.pending_calls.get(message[1])
+                if future is not None and not future.done():
+                    future.set_result(message[2])
+
+    async def report(self):
+        """Log the update rate the front publishes, summed over all workers"""
+        while True:
+            published = self.published
+            await asyncio.sleep(REPORT_INTERVAL)
+            _logger.info(
+                "%d workers: %.2f updates/s published",
+                len(self.processes) - len(self.lost),
+                (self.published - published) / REPORT_INTERVAL,
+            )
+
+    async def main(self):
+        server, idx = await EdgeServer.init_server()
+        self.start_workers()
+        try:
+            ready = await self.wait_ready()
+            await self.build(server, idx, ready)
+            self.alarm = await Alarm.create_alarm(server)
+            reporter = asyncio.create_task(self.report())
+            async with server:
+                await asyncio.gather(
+                    *[self.receive(conn) for conn in set(self.conns.values())]
+                )
+            reporter.cancel()
+        finally:
+            for conn in set(self.conns.values()):
+                try:
+                    conn.send(("stop",))
+                except OSError:
+                    pass  # worker already gone
+            for process in self.processes:
+                process.join(timeout=5)
+
+
+def sensor_urls(count, mode="port", host=HOST, base_port=BASE_PORT, processes=1):
+    """Sensor endpoints of a fleet started by opc_tsensor_fleet"""
+    return {
+        str(number): sensor_endpoint(number, mode, processes, host, base_port)
+        for number in range(1, count + 1)
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sharded multi-process edge server")
+    parser.add_argument("-n", "--sensors", type=int, default=1)
+    parser.add_argument(
+        "-w", "--workers", type=int, default=multiprocessing.cpu_count()
+    )
+    parser.add_argument("--mode", choices=["port", "object"], default="port")
+    parser.add_argument("--base-port", type=int, default=BASE_PORT)
+    parser.add_argument(
+        "--fleet-processes",
+        type=int,
+        default=1,
+        help="processes the fleet was started with (object mode)",
+    )
+    parser.add_argument("--security", default=CLIENT_SECURITY)
+    parser.add_argument("--no-recording", action="store_true")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("asyncua").setLevel(logging.WARNING)
+    edge = ShardedEdge(
+        sensor_urls(
+            args.sensors, args.mode, HOST, args.base_port, args.fleet_processes
+        ),
+        args.workers,
+        args.security,
+        not args.no_recording,
+    )
+    asyncio.run(edge.main())
@@ -2,11 +2,18 @@ import asyncio
 import copy
 import logging
 import statistics
+import time
+import warnings
 
-from asyncua import Client, Server, ua
+import numpy as np
+from asyncua import Server, ua
 from asyncua.common.methods import uamethod
 from asyncua.common.xmlexporter import XmlExporter
 
+from opc_session import SessionPool, load_server_certificate
+from packed_array import PlainArrays, pack_array, packed_variant, unpack_array
+from sample_recorder import SampleRecorder
+
 _logger = logging.getLogger(__name__)
 
 # Server settings
@@ -19,8 +26,23 @@ SECURITY_POLICIES = [
 ]
 NAMESPACE_URI = "http://sample.sensor2hmi.io"
 
+# Record every sample array of each monitor to disk
+RECORDING = True
+
+# Analytics published under each monitor
+ANALYTICS_PERCENTILES = [5, 25, 50, 75, 95]
+ANALYTICS_COLUMNS = [
+    "mean",
+    "stdev",
+    "min",
+    "max",
+    *[f"p{p}" for p in ANALYTICS_PERCENTILES],
+]
+BATCH_COLUMNS = [*ANALYTICS_COLUMNS, "above_high", "below_low", "count"]
+
 # Client settings
 CLIENT_URL = "opc.tcp://localhost:4850/freeopcua/temp_sensor1/"
+CLIENT_SECURITY = ""  # e.g. "Basic256Sha256,SignAndEncrypt"
 
 
 class SubHandler(object):
@@ -50,6 +72,70 @@ def temp_data_preprocess(parent, data):
     return mean, std_deviation
 
 
+def decode_update(value):
+    """Return (packed blob, samples) of a sensor data update, or None to skip it"""
+    if isinstance(value, bytes):
+        try:
+            blob, samples = value, unpack_array(value)
+        except ValueError as exp:
+            _logger.warning("skipping malformed packed data: %s", exp)
+            return None
+    else:
+        samples = np.asarray(value, dtype=np.float64)
+        blob = None
+    if samples.size == 0:
+        return None  # e.g. the initial value of a sensor that has not published yet
+    return blob if blob is not None else pack_array(samples), samples
+
+
+def compute_analytics(data):
+    samples = np.asarray(data, dtype=np.float64)
+    if samples.size == 0:
+        return None
+    return {
+        "mean": float(samples.mean()),
+        "stdev": float(samples.std(ddof=1)) if samples.size > 1 else 0.0,
+        "min": float(samples.min()),
+        "max": float(samples.max()),
+        "percentiles": np.percentile(samples, ANALYTICS_PERCENTILES).tolist(),
+    }
+
+
+def compute_batch_analytics(rows, thresholds_high, thresholds_low):
+    # rows may differ in length: pad with NaN and use the NaN-aware reductions
+    counts = np.array([row.size for row in rows], dtype=np.float64)
+    stacked = np.full((len(rows), int(counts.max(initial=1))), np.nan)
+    for i, row in enumerate(rows):
+        stacked[i, : row.size] = row
+    high = np.asarray(thresholds_high, dtype=np.float64)[:, None]
+    low = np.asarray(thresholds_low, dtype=np.float64)[:, None]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # empty or single rows
+        stdev = np.nanstd(stacked, axis=1, ddof=1)
+        columns = [
+            np.nanmean(stacked, axis=1),
+            np.where(counts == 1, 0.0, stdev),
+            np.nanmin(stacked, axis=1),
+            np.nanmax(stacked, axis=1),
+            *np.nanpercentile(stacked, ANALYTICS_PERCENTILES, axis=1),
+            (stacked > high).sum(axis=1),
+            (stacked < low).sum(axis=1),
+            counts,
+        ]
+    return np.column_stack(columns).reshape(len(rows), len(BATCH_COLUMNS))
+
+
+def check_thresholds(data, threshold_high, threshold_low):
+    # the first out-of-range sample decides which alarm is raised
+    samples = np.asarray(data, dtype=np.float64)
+    out_of_range = (samples > threshold_high) | (samples < threshold_low)
+    if not out_of_range.any():
+        return None
+    if samples[out_of_range.argmax()] > threshold_high:
+        return "OVERHEAT!"
+    return "OVERCOOL!"
+
+
 class EdgeServer:
     @staticmethod
     async def init_server():
@@ -58,6 +144,7 @@ class EdgeServer:
         server.set_endpoint(SERVER_ENDPOINT)
         server.set_server_name(SERVER_NAME)
         server.set_security_policy(SECURITY_POLICIES)
+        await load_server_certificate(server, SERVER_NAME)
         idx = await server.register_namespace(NAMESPACE_URI)
         _logger.info(f"Server Namespace index: {idx}")
         return server, idx
@@ -80,10 +167,12 @@ class EdgeServer:
 
 class SensorClient:
     @staticmethod
-    async def init_client():
-        client = Client(url=CLIENT_URL)
-        await client.connect()
-        idx = await client.get_namespace_index(NAMESPACE_URI)
+    async def init_client(security=CLIENT_SECURITY):
+        # pooled so the channel and session are reused on reconnect; the session
+        # restores subscriptions made through it when the sensor comes back
+        session = await SessionPool.get(CLIENT_URL, security)
+        client = session.client
+        idx = await session.get_namespace_index(NAMESPACE_URI)
         _logger.info(f"Client Namespace index: {idx}")
 
         temp_sensor = client.get_node(ua.NodeId(5, 2))
@@ -98,7 +187,7 @@ class SensorClient:
         threshold_low_value = copy.copy(await threshold_low.read_value())
 
         return (
-            client,
+            session,
             idx,
             temp_sensor,
             data,
@@ -112,9 +201,17 @@ class SensorClient:
         )
 
     @staticmethod
-    async def subscribe_to_data_change(client, data):
+    async def find_packed_data(temp_sensor):
+        # sensors that offer the packed encoding expose it next to the plain array
+        try:
+            return await temp_sensor.get_child(["2:data_packed"])
+        except ua.UaStatusCodeError:
+            return None
+
+    @staticmethod
+    async def subscribe_to_data_change(session, data):
         handler = SubHandler()
-        sub = await client.create_subscription(50, handler)
+        sub = await session.create_subscription(50, handler)
         handle = await sub.subscribe_data_change(data)
         return sub, handler
 
@@ -122,28 +219,141 @@ class SensorClient:
 class TempMonitor:
     @staticmethod
     async def instantiate_temp_monitor(
-        idx, server, sensor_monitor_type, data, state, threshold_high, threshold_low
+        idx,
+        server,
+        sensor_monitor_type,
+        data,
+        state,
+        threshold_high,
+        threshold_low,
+        suffix="1",
+        analyze=temp_data_preprocess,
     ):
         temp_sm_1 = await server.nodes.objects.add_object(
-            idx, "temp_sm_1", sensor_monitor_type
+            idx, f"temp_sm_{suffix}", sensor_monitor_type
         )
-        tsm_data1 = await temp_sm_1.add_variable(idx, "tsm_data1", data)
-        tsm_state1 = await temp_sm_1.add_variable(idx, "tsm_state1", state)
+        tsm_data1 = await temp_sm_1.add_variable(idx, f"tsm_data{suffix}", data)
+        tsm_state1 = await temp_sm_1.add_variable(idx, f"tsm_state{suffix}", state)
         await tsm_state1.set_writable()
         tsm_config1 = await temp_sm_1.add_variable(
-            idx, "tsm_config1", [threshold_high, threshold_low]
+            idx, f"tsm_config{suffix}", [threshold_high, threshold_low]
         )
         await tsm_config1.set_writable()
         tsm_analyze1 = await temp_sm_1.add_method(
             idx,
-            "tsm_analyze1",
-            temp_data_preprocess,
+            f"tsm_analyze{suffix}",
+            analyze,
             [ua.VariantType.Float],
             [ua.VariantType.Float, ua.VariantType.Float],
         )
         await tsm_config1.set_writable()
-        tsm_op_mode1 = await temp_sm_1.add_property(idx, "tsm_op_mode1", "normal")
-        return temp_sm_1, tsm_data1, tsm_state1, tsm_config1, tsm_op_mode1, tsm_analyze1
+        tsm_op_mode1 = await temp_sm_1.add_property(
+            idx, f"tsm_op_mode{suffix}", "normal"
+        )
+        tsm_stats1 = await TempMonitor.add_analytics_variable(idx, temp_sm_1, suffix)
+        tsm_data_packed1 = await temp_sm_1.add_variable(
+            idx, f"tsm_data_packed{suffix}", packed_variant(data)
+        )
+        return (
+            temp_sm_1,
+            tsm_data1,
+            tsm_state1,
+            tsm_config1,
+            tsm_op_mode1,
+            tsm_analyze1,
+            tsm_stats1,
+            tsm_data_packed1,
+        )
+
+    @staticmethod
+    async def add_batch_method(server, idx, monitors):
+        """Add tsm_analyze_batch; monitors maps names to (packed data, config) nodes"""
+
+        @uamethod
+        async def analyze_batch(parent, arrays, monitor_names, thresholds):
+            # every row of every packed array is one slice, using the given thresholds
+            if thresholds and len(thresholds) != 2:
+                return ua.StatusCode(ua.StatusCodes.BadInvalidArgument)
+            high, low = thresholds if thresholds else (np.inf, -np.inf)
+            rows = []
+            for blob in arrays or []:
+                try:
+                    array = np.atleast_2d(unpack_array(blob))
+                except ValueError:
+                    return ua.StatusCode(ua.StatusCodes.BadInvalidArgument)
+                if array.size == 0:
+                    return ua.StatusCode(ua.StatusCodes.BadInvalidArgument)
+                rows.extend(array.reshape(-1, array.shape[-1]))
+            highs = [high] * len(rows)
+            lows = [low] * len(rows)
+            # monitor references use their latest data and their own tsm_config
+            for name in monitor_names or []:
+                if name not in monitors:
+                    return ua.StatusCode(ua.StatusCodes.BadInvalidArgument)
+                data_packed, config = monitors[name]
+                rows.append(unpack_array(await data_packed.read_value()).ravel())
+                monitor_high, monitor_low = await config.read_value()
+                highs.append(monitor_high)
+                lows.append(monitor_low)
+            stats = compute_batch_analytics(rows, highs, lows)
+            return (
+                ua.Variant(pack_array(stats), ua.VariantType.ByteString),
+                ua.Variant(BATCH_COLUMNS, ua.VariantType.String),
+            )
+
+        return await server.nodes.objects.add_method(
+            idx,
+            "tsm_analyze_batch",
+            analyze_batch,
+            [
+                TempMonitor.argument("arrays", ua.VariantType.ByteString, True),
+                TempMonitor.argument("monitors", ua.VariantType.String, True),
+                TempMonitor.argument("thresholds", ua.VariantType.Double, True),
+            ],
+            [
+                TempMonitor.argument("stats", ua.VariantType.ByteString),
+                TempMonitor.argument("columns", ua.VariantType.String, True),
+            ],
+        )
+
+    @staticmethod
+    def argument(name, variant_type, array=False):
+        arg = ua.Argument()
+        arg.Name = name
+        arg.DataType = ua.NodeId(variant_type.value)
+        arg.ValueRank = 1 if array else -1
+        arg.ArrayDimensions = [0] if array else []
+        return arg
+
+    @staticmethod
+    async def add_analytics_variable(idx, monitor, suffix):
+        # one array per update, so subscribers never see values of two updates mixed
+        stats = await monitor.add_variable(
+            idx,
+            f"tsm_analytics{suffix}",
+            ua.Variant([0.0] * len(ANALYTICS_COLUMNS), ua.VariantType.Double),
+        )
+        await monitor.add_property(
+            idx, f"tsm_analytics_columns{suffix}", ANALYTICS_COLUMNS
+        )
+        return stats
+
+    @staticmethod
+    async def publish_analytics(stats_node, data):
+        await TempMonitor.write_analytics(stats_node, compute_analytics(data))
+
+    @staticmethod
+    async def write_analytics(stats_node, analytics):
+        if analytics is None:
+            return
+        row = [
+            analytics["mean"],
+            analytics["stdev"],
+            analytics["min"],
+            analytics["max"],
+            *analytics["percentiles"],
+        ]
+        await stats_node.write_value(ua.Variant(row, ua.VariantType.Double))
 
     @staticmethod
     async def export_nodes_to_xml(server, nodes):
@@ -167,7 +377,7 @@ async def main():
     )
 
     (
-        client,
+        session,
         client_idx,
         temp_sensor,
         data,
@@ -179,7 +389,10 @@ async def main():
         threshold_high_value,
         threshold_low_value,
     ) = await SensorClient.init_client()
-    sub, handler = await SensorClient.subscribe_to_data_change(client, data)
+    data_packed = await SensorClient.find_packed_data(temp_sensor)
+    sub, handler = await SensorClient.subscribe_to_data_change(
+        session, data if data_packed is None else data_packed
+    )
 
     (
         temp_sm_1,
@@ -188,6 +401,8 @@ async def main():
         tsm_config1,
         tsm_op_mode1,
         tsm_analyze1,
+        tsm_stats1,
+        tsm_data_packed1,
     ) = await TempMonitor.instantiate_temp_monitor(
         server_idx,
         server,
@@ -197,28 +412,82 @@ async def main():
         threshold_high_value,
         threshold_low_value,
     )
+    tsm_analyze_batch = await TempMonitor.add_batch_method(
+        server, server_idx, {"temp_sm_1": (tsm_data_packed1, tsm_config1)}
+    )
     await TempMonitor.export_nodes_to_xml(
         server,
-        [temp_sm_1, tsm_data1, tsm_state1, tsm_config1, tsm_op_mode1, tsm_analyze1],
+        [
+            temp_sm_1,
+            tsm_data1,
+            tsm_state1,
+            tsm_config1,
+            tsm_op_mode1,
+            tsm_analyze1,
+            tsm_stats1,
+            tsm_data_packed1,
+            tsm_analyze_batch,
+        ],
     )
 
     temp_alarm = await Alarm.create_alarm(server)
+    recorder = SampleRecorder("temp_sm_1") if RECORDING else None
+    plain = PlainArrays(server)
+    plain.add(tsm_data1)
 
     async with server:
-        while True:
-            if handler.has_data_changed():
-                changed_data = handler.get_changed_data()
-                await tsm_data1.write_value(changed_data)
-                for temp in changed_data:
-                    if temp > threshold_high_value:
-                        await temp_alarm.trigger(message="OVERHEAT!")
-                        _logger.warning("OVERHEAT!")
-                        break
-                    elif temp < threshold_low_value:
-                        await temp_alarm.trigger(message="OVERCOOL!")
-                        _logger.warning("OVERCOOL!")
-                        break
-            await asyncio.sleep(0.1)
+        try:
+            await monitor_loop(
+                handler,
+                tsm_data1,
+                tsm_data_packed1,
+                tsm_stats1,
+                temp_alarm,
+                recorder,
+                threshold_high_value,
+                threshold_low_value,
+                plain,
+            )
+        finally:
+            if recorder is not None:
+                recorder.close()
+
+
+async def monitor_loop(
+    handler,
+    tsm_data1,
+    tsm_data_packed1,
+    tsm_stats1,
+    temp_alarm,
+    recorder,
+    threshold_high_value,
+    threshold_low_value,
+    plain,
+):
+    while True:
+        update = None
+        if handler.has_data_changed():
+            update = decode_update(handler.get_changed_data())
+        if update is not None:
+            # a packed blob is forwarded as is, decoded without a Python loop
+            blob, samples = update
+            await tsm_data_packed1.write_value(
+                ua.Variant(blob, ua.VariantType.ByteString)
+            )
+            # tsm_data1 is only encoded while a client reads or monitors it
+            await plain.update(tsm_data1, samples)
+            if recorder is not None:
+                # only buffers in memory, the recorder's thread does the disk I/O
+                recorder.record(time.time(), samples)
+            # computed once here so HMIs subscribe instead of calling tsm_analyze1
+            await TempMonitor.publish_analytics(tsm_stats1, samples)
+            message = check_thresholds(
+                samples, threshold_high_value, threshold_low_value
+            )
+            if message is not None:
+                await temp_alarm.trigger(message=message)
+                _logger.warning(message)
+        await asyncio.sleep(0.1)
 
 
 if __name__ == "__main__":
@@ -1,11 +1,15 @@
 import asyncio
 import copy
 import logging
-from asyncua import Client, ua
+from asyncua import ua
+
+from opc_session import SessionClient
+from packed_array import pack_array, unpack_array
 
 _LOGGER = logging.getLogger(__name__)
 _SERVER_URL = "opc.tcp://localhost:4860/freeopcua/edge/"
 _NAMESPACE_URI = "http://sample.sensor2hmi.io"
+_SECURITY = ""  # e.g. "Basic256Sha256,SignAndEncrypt"
 
 
 class SubHandler(object):
@@ -28,65 +32,104 @@ class SubHandler(object):
         pass
 
 
+class AnalyticsHandler(object):
+    def __init__(self):
+        self.columns = []  # names of the tsm_analytics entries
+        self.stats = None
+        self.stats_changed = False
+
+    def datachange_notification(self, node, val, data):
+        # the edge publishes all analytics of one update as a single array
+        self.stats = dict(zip(self.columns, val))
+        self.stats_changed = True
+
+    def get_stats(self):
+        self.stats_changed = False  # reset flag
+        return self.stats
+
+    def has_stats_changed(self):
+        return self.stats_changed
+
+    def event_notification(self, event):
+        pass
+
+
 class AsyncUAClient:
-    def __init__(self, url):
+    def __init__(self, url, security=_SECURITY):
         self.url = url
-        self.client = Client(url=self.url)
+        self.session = SessionClient(url, security)
+        self.client = self.session.client
 
     async def get_data(self, node_id):
         data_node = self.client.get_node(ua.NodeId(node_id, 2))
         return copy.copy(await data_node.read_value())
 
+    async def analyze_batch(self, monitors, arrays=(), thresholds=()):
+        # one round trip for many monitors and/or packed arrays of slices
+        stats, columns = await self.client.nodes.objects.call_method(
+            "2:tsm_analyze_batch",
+            ua.Variant(
+                [pack_array(array) for array in arrays], ua.VariantType.ByteString
+            ),
+            ua.Variant(list(monitors), ua.VariantType.String),
+            ua.Variant(list(thresholds), ua.VariantType.Double),
+        )
+        return unpack_array(stats), columns
+
     async def call_method(self, node_path, method_name, data):
-        node = await self.client.nodes.root.get_child(node_path)
+        node = await self.session.get_child(node_path)
         return await node.call_method(method_name, data)
 
     async def create_subscription(self, handler):
-        return await self.client.create_subscription(500, handler)
+        # made through the session so it is transferred or re-created on reconnect
+        return await self.session.create_subscription(500, handler)
 
     async def subscribe_to_data_change(self, sub, node_path):
-        data_node = await self.client.nodes.root.get_child(node_path)
+        data_node = await self.session.get_child(node_path)
         return await sub.subscribe_data_change(data_node)
 
+    async def subscribe_to_analytics(self, sub, handler, monitor_path, suffix):
+        columns = await self.session.get_child(
+            monitor_path + [f"2:tsm_analytics_columns{suffix}"]
+        )
+        handler.columns = await columns.read_value()
+        node = await self.session.get_child(monitor_path + [f"2:tsm_analytics{suffix}"])
+        return await sub.subscribe_data_change(node)
+
     async def subscribe_to_events(self, sub):
         return await sub.subscribe_events()
 
 
 async def main():
     client = AsyncUAClient(_SERVER_URL)
-    async with client.client as ua_client:
+    async with client.session as ua_client:
         _LOGGER.info("Root node is: %r", ua_client.nodes.root)
         _LOGGER.info(
             "Children of root are: %r", await ua_client.nodes.root.get_children()
         )
 
-        idx = await ua_client.get_namespace_index(_NAMESPACE_URI)
+        idx = await client.session.get_namespace_index(_NAMESPACE_URI)
         _LOGGER.info("index of our namespace is %s", idx)
 
-        # get data
-        data = await client.get_data(7)
-
-        # call ua method
-        mu, sigma = await client.call_method(
-            ["0:Objects", "2:temp_sm_1"], "2:tsm_analyze1", data
-        )
-
-        # subscribing to a variable node & event
-        handler = SubHandler()
+        # subscribing to the analytics the edge precomputes & alarm events
+        handler = AnalyticsHandler()
         sub = await client.create_subscription(handler)
-        handle_data = await client.subscribe_to_data_change(
-            sub, ["0:Objects", "2:temp_sm_1", "2:tsm_data1"]
+        handle_stats = await client.subscribe_to_analytics(
+            sub, handler, ["0:Objects", "2:temp_sm_1"], "1"
         )
         handle_alarm = await client.subscribe_to_events(sub)
 
         while True:
-            if handler.has_data_changed():
-                changed_data = handler.get_changed_data()
-                mu, sigma = await client.call_method(
-                    ["0:Objects", "2:temp_sm_1"], "2:tsm_analyze1", changed_data
-                )
+            if handler.has_stats_changed():
+                stats = handler.get_stats()
+                percentiles = [
+                    value for name, value in stats.items() if name.startswith("p")
+                ]
                 print(
-                    f"the mean value & standard deviation of the data is {mu} & {sigma}"
+                    f"the mean value & standard deviation of the data is "
+                    f"{stats['mean']} & {stats['stdev']}, "
+                    f"min/max {stats['min']}/{stats['max']}, "
+                    f"percentiles {percentiles}"
                 )
             await asyncio.sleep(1)
 
@@ -0,0 +1,251 @@
+import argparse
+import asyncio
+import csv
+import logging
+import multiprocessing
+import statistics
+import time
+
+from asyncua import Server, ua
+
+from opc_session import SessionClient, load_server_certificate
+
+_logger = logging.getLogger(__name__)
+
+# Benchmark settings
+BENCH_ENDPOINT = "opc.tcp://localhost:4870/freeopcua/bench/"
+BENCH_SERVER_NAME = "Security_Bench"
+NAMESPACE_URI = "http://sample.sensor2hmi.io"
+SECURITY_POLICIES = [
+    ua.SecurityPolicyType.NoSecurity,
+    ua.SecurityPolicyType.Basic256Sha256_SignAndEncrypt,
+    ua.SecurityPolicyType.Basic256Sha256_Sign,
+]
+CLIENT_SECURITY = {
+    "NoSecurity": "",
+    "Basic256Sha256_Sign": "Basic256Sha256,Sign",
+    "Basic256Sha256_SignAndEncrypt": "Basic256Sha256,SignAndEncrypt",
+}
+PAYLOAD_SIZES = [10, 100, 1000, 10000]
+
+
+class SubHandler(object):
+    def __init__(self):
+        self.notifications = 0
+
+    def datachange_notification(self, node, val, data):
+        self.notifications += 1
+
+    def event_notification(self, event):
+        pass
+
+
+class BenchServer:
+    """Server exposing one Double array per payload size and a publisher switch"""
+
+    @staticmethod
+    async def setup(endpoint, sizes):
+        server = Server()
+        await server.init()
+        server.set_endpoint(endpoint)
+        server.set_server_name(BENCH_SERVER_NAME)
+        server.set_security_policy(SECURITY_POLICIES)
+        await load_server_certificate(server, BENCH_SERVER_NAME)
+        idx = await server.register_namespace(NAMESPACE_URI)
+        bench = await server.nodes.objects.add_object(idx, "bench")
+        arrays = {}
+        for size in sizes:
+            arrays[size] = await bench.add_variable(
+                idx,
+                f"bench_data_{size}",
+                ua.Variant([0.0] * size, ua.VariantType.Double),
+            )
+        # size of the array to publish continuously, 0 stops the publisher
+        publish_size = await bench.add_variable(
+            idx, "bench_publish_size", 0, ua.VariantType.Int32
+        )
+        await publish_size.set_writable()
+        return server, arrays, publish_size
+
+    @staticmethod
+    async def publish(arrays, publish_size):
+        counter = 0.0
+        while True:
+            size = await publish_size.read_value()
+            if size in arrays:
+                counter += 1
+                await arrays[size].write_value(
+                    ua.Variant([counter] * size, ua.VariantType.Double)
+                )
+                await asyncio.sleep(0)
+            else:
+                await asyncio.sleep(0.05)
+
+    @staticmethod
+    async def main(endpoint, sizes):
+        server, arrays, publish_size = await BenchServer.setup(endpoint, sizes)
+        async with server:
+            await BenchServer.publish(arrays, publish_size)
+
+
+def run_server(endpoint, sizes):
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(BenchServer.main(endpoint, sizes))
+
+
+class SecurityBenchmark:
+    """Measures connect time, request latency and notification throughput per policy"""
+
+    @staticmethod
+    async def resolve(client, size):
+        bench = await client.nodes.objects.get_child(["2:bench"])
+        return (
+            await bench.get_child([f"2:bench_data_{size}"]),
+            await bench.get_child(["2:bench_publish_size"]),
+        )
+
+    @staticmethod
+    async def measure_connect(endpoint, security, repeat):
+        connect_times, reconnect_times = [], []
+        for _ in range(repeat):
+            session = SessionClient(endpoint, security)
+            await session.connect()
+            connect_times.append(session.connect_time)
+            # a live subscription keeps the server-side session across the channel drop
+            await session.client.create_subscription(1000, SubHandler())
+            await session.reconnect()
+            reconnect_times.append(session.connect_time)
+            await session.disconnect()
+        return statistics.mean(connect_times), statistics.mean(reconnect_times)
+
+    @staticmethod
+    async def measure_latency(data_node, repeat):
+        latencies = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            await data_node.read_value()
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        return statistics.mean(latencies), latencies[int(0.95 * (len(latencies) - 1))]
+
+    @staticmethod
+    async def measure_throughput(client, data_node, publish_size, size, duration):
+        handler = SubHandler()
+        sub = await client.create_subscription(0, handler)
+        await sub.subscribe_data_change(data_node, queuesize=10000)
+        await publish_size.write_value(ua.Variant(size, ua.VariantType.Int32))
+        await asyncio.sleep(0.5)  # warm up
+        start_count, start = handler.notifications, time.perf_counter()
+        await asyncio.sleep(duration)
+        count, elapsed = (
+            handler.notifications - start_count,
+            time.perf_counter() - start,
+        )
+        await publish_size.write_value(ua.Variant(0, ua.VariantType.Int32))
+        await sub.delete()
+        return count / elapsed
+
+    @staticmethod
+    async def wait_for_server(endpoint, timeout=30):
+        deadline = time.monotonic() + timeout
+        while True:
+            session = SessionClient(endpoint)
+            try:
+                await session.connect()
+            except (OSError, asyncio.TimeoutError):
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.2)
+            else:
+                await session.disconnect()
+                return
+
+    @staticmethod
+    async def run(endpoint, policies, sizes, repeat, duration):
+        await SecurityBenchmark.wait_for_server(endpoint)
+        results = []
+        for policy in policies:
+            security = CLIENT_SECURITY[policy]
+            connect_time, reconnect_time = await SecurityBenchmark.measure_connect(
+                endpoint, security, repeat
+            )
+            session = SessionClient(endpoint, security)
+            await session.connect()
+            try:
+                for size in sizes:
+                    data_node, publish_size = await SecurityBenchmark.resolve(
+                        session.client, size
+                    )
+                    latency, latency_p95 = await SecurityBenchmark.measure_latency(
+                        data_node, repeat * 10
+                    )
+                    rate = await SecurityBenchmark.measure_throughput(
+                        session.client, data_node, publish_size, size, duration
+                    )
+                    result = {
+                        "policy": policy,
+                        "payload_size": size,
+                        "connect_ms": connect_time * 1000,
+                        "reconnect_ms": reconnect_time * 1000,
+                        "read_latency_ms": latency * 1000,
+                        "read_latency_p95_ms": latency_p95 * 1000,
+                        "notifications_per_s": rate,
+                        "samples_per_s": rate * size,
+                    }
+                    _logger.info(
+                        "%s size=%d: connect %.1f ms, reconnect %.1f ms, "
+                        "read %.2f ms (p95 %.2f ms), %.0f notifications/s",
+                        policy,
+                        size,
+                        result["connect_ms"],
+                        result["reconnect_ms"],
+                        result["read_latency_ms"],
+                        result["read_latency_p95_ms"],
+                        rate,
+                    )
+                    results.append(result)
+            finally:
+                await session.disconnect()
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OPC UA security policy benchmark")
+    parser.add_argument("--endpoint", default=BENCH_ENDPOINT)
+    parser.add_argument(
+        "--policy", action="append", choices=list(CLIENT_SECURITY), default=None
+    )
+    parser.add_argument("--size", action="append", type=int, default=None)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--csv", help="write the results to this CSV file")
+    args = parser.parse_args()
+    policies = args.policy or list(CLIENT_SECURITY)
+    sizes = args.size or PAYLOAD_SIZES
+
+    # the server runs in its own process so it does not share the client's core
+    server_process = multiprocessing.Process(
+        target=run_server, args=(args.endpoint, sizes), daemon=True
+    )
+    server_process.start()
+    try:
+        results = asyncio.run(
+            SecurityBenchmark.run(
+                args.endpoint, policies, sizes, args.repeat, args.duration
+            )
+        )
+    finally:
+        server_process.terminate()
+        server_process.join()
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0]))
+            writer.writeheader()
+            writer.writerows(results)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("asyncua").setLevel(logging.ERROR)
+    main()
@@ -0,0 +1,259 @@
+import logging
+import os
+import socket
+import time
+from pathlib import Path
+
+from asyncua import Client
+from asyncua.client.ua_client import UaClientState
+from asyncua.crypto.cert_gen import setup_self_signed_certificate
+from asyncua.crypto.uacrypto import check_certificate, load_certificate
+from asyncua.observer import Observer
+from cryptography.x509.oid import ExtendedKeyUsageOID
+
+_logger = logging.getLogger(__name__)
+
+# Certificate settings
+CERT_DIR = Path(__file__).resolve().parent / "certs"
+CLIENT_APP_URI = "urn:sample.sensor2hmi.io:client"
+SERVER_APP_URI = "urn:sample.sensor2hmi.io:server"
+
+# Channel settings
+SECURE_CHANNEL_TIMEOUT = 600000  # ms
+RECONNECT_TIMEOUT = 10.0  # seconds reconnect() waits for the session to return
+
+# Supervision settings
+KEEPALIVE_INTERVAL = 5.0  # seconds between server state probes of an idle link
+# asyncua retries once at once, then waits a fixed 1 s before the second attempt
+# (it has no setting for that first delay); later waits are capped at this
+RECONNECT_MAX_DELAY = 0.5
+
+
+async def ensure_certificates(name, app_uri, server=False, cert_dir=None):
+    """Return (cert, key) paths for name, generating a self-signed pair if needed.
+
+    The pair is regenerated when missing or issued for another app_uri or host,
+    and renamed into place so no reader sees a half-written file.
+    """
+    cert_dir = Path(cert_dir or CERT_DIR)
+    cert_dir.mkdir(parents=True, exist_ok=True)
+    cert_file = cert_dir / f"{name}_cert.der"
+    key_file = cert_dir / f"{name}_key.pem"
+    if cert_file.exists() and key_file.exists():
+        cert = await load_certificate(cert_file)
+        if not check_certificate(cert, app_uri, socket.gethostname()):
+            return cert_file, key_file
+    _logger.info("generating test certificate %s", cert_file)
+    tmp_cert_file = cert_dir / f".{name}_cert.der.{os.getpid()}"
+    tmp_key_file = cert_dir / f".{name}_key.pem.{os.getpid()}"
+    await setup_self_signed_certificate(
+        tmp_key_file,
+        tmp_cert_file,
+        app_uri,
+        socket.gethostname(),
+        [
+            (
+                ExtendedKeyUsageOID.SERVER_AUTH
+                if server
+                else ExtendedKeyUsageOID.CLIENT_AUTH
+            )
+        ],
+        {
+            "countryName": "TW",
+            "organizationName": "sensor2hmi",
+            "commonName": name,
+        },
+    )
+    os.replace(tmp_key_file, key_file)
+    os.replace(tmp_cert_file, cert_file)
+    return cert_file, key_file
+
+
+def server_app_uri(name):
+    """ApplicationUri of the server called name"""
+    return f"{SERVER_APP_URI}:{name}"
+
+
+async def load_server_certificate(server, name):
+    """Load (or generate) the certificate that backs the server's secure endpoints"""
+    app_uri = server_app_uri(name)
+    cert_file, key_file = await ensure_certificates(name, app_uri, server=True)
+    await server.set_application_uri(app_uri)
+    await server.load_certificate(str(cert_file))
+    await server.load_private_key(str(key_file))
+
+
+class RecoveryTimer(Observer):
+    """Logs how long data takes to flow again after the connection was lost.
+
+    Two times are reported: from the socket of the successful reconnect
+    attempt opening to the first data notification (or to the session being
+    back, if it has no subscriptions), and the whole outage since the loss
+    was detected. The first excludes the backoff wait before that attempt.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.lost_at = None
+        self.socket_open_at = None
+
+    def on_state_change(self, state):
+        if state is UaClientState.RECONNECTING:
+            if self.lost_at is None:
+                self.lost_at = time.perf_counter()
+                _logger.warning("lost connection to %s, reconnecting", self.session.url)
+            self.socket_open_at = None  # that attempt failed
+        elif state is UaClientState.SOCKET_OPEN and self.lost_at is not None:
+            self.socket_open_at = time.perf_counter()
+        elif state is UaClientState.CONNECTED and not self.session.subscriptions:
+            self._recovered()
+
+    def on_notification(self, subscription_id, event_count):
+        if event_count:
+            self._recovered()
+
+    def _recovered(self):
+        if self.lost_at is None or self.socket_open_at is None:
+            return
+        now = time.perf_counter()
+        _logger.warning(
+            "recovered %s: %.0f ms from socket open to first notification, "
+            "%.1f s since the connection was lost",
+            self.session.url,
+            (now - self.socket_open_at) * 1000,
+            now - self.lost_at,
+        )
+        self.lost_at = None
+        self.socket_open_at = None
+
+
+class SessionClient:
+    """Client that keeps its secure channel and session alive and reuses them.
+
+    security is empty for NoSecurity or "Policy,Mode", e.g.
+    "Basic256Sha256,SignAndEncrypt"; test certificates are generated locally.
+    Connects through Client.connect() with auto_reconnect, so asyncua renews
+    the channel token and, when the transport drops, re-activates the existing
+    session on a new channel before falling back to a new session.
+
+    Reconnect attempts back off exponentially up to RECONNECT_MAX_DELAY, and
+    asyncua transfers or re-creates the subscriptions afterwards. Node
+    resolutions and namespace indexes are cached, so recovery does not browse
+    again; RecoveryTimer logs how long each recovery took.
+    """
+
+    def __init__(self, url, security="", name="sensor2hmi_client"):
+        self.url = url
+        self.security = security
+        self.name = name
+        self.client = Client(url=url, watchdog_intervall=KEEPALIVE_INTERVAL)
+        self.client.application_uri = CLIENT_APP_URI
+        self.client.secure_channel_timeout = SECURE_CHANNEL_TIMEOUT
+        self.connected = False
+        self.connect_time = None  # seconds taken by the last (re)connect
+        self.subscriptions = []
+        self._resolved = {}  # browse path -> NodeId
+        self._namespaces = {}  # namespace uri -> index
+        self._security_set = False
+        self.client.uaclient.observer = RecoveryTimer(self)
+
+    async def __aenter__(self):
+        await self.connect()
+        return self.client
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.disconnect()
+
+    async def _set_security(self):
+        if self._security_set or not self.security:
+            return
+        cert_file, key_file = await ensure_certificates(self.name, CLIENT_APP_URI)
+        await self.client.set_security_string(f"{self.security},{cert_file},{key_file}")
+        self._security_set = True
+
+    async def connect(self):
+        """Full handshake: socket, hello, secure channel, create & activate session"""
+        await self._set_security()
+        start = time.perf_counter()
+        await self.client.connect(
+            auto_reconnect=True, reconnect_max_delay=RECONNECT_MAX_DELAY
+        )
+        self.connect_time = time.perf_counter() - start
+        self.connected = True
+        self._log_connected()
+
+    async def reconnect(self):
+        """Drop the transport and wait for the session to be re-activated.
+
+        asyncua's supervisor repeats only the secure channel handshake and
+        ActivateSession; CreateSession and its signature round trip are
+        skipped unless the server no longer knows the session. Returns True
+        if the session was reused.
+        """
+        if not self.connected:
+            await self.connect()
+            return False
+        token = self.client.uaclient.session.authentication_token
+        start = time.perf_counter()
+        async with self.client.subscribe_state() as state:
+            self.client.uaclient.notify_transport_lost()
+            await state.wait_for_state(UaClientState.CONNECTED, RECONNECT_TIMEOUT)
+        self.connect_time = time.perf_counter() - start
+        self._log_connected()
+        return self.client.uaclient.session.authentication_token == token
+
+    async def disconnect(self):
+        if self.connected:
+            self.connected = False
+            await self.client.disconnect()
+
+    async def create_subscription(self, period, handler):
+        # asyncua tracks it and restores it after every reconnect
+        subscription = await self.client.create_subscription(period, handler)
+        self.subscriptions.append(subscription)
+        return subscription
+
+    async def get_child(self, path):
+        """Resolve a browse path from the root node, cached across reconnects"""
+        key = tuple(path)
+        if key not in self._resolved:
+            node = await self.client.nodes.root.get_child(path)
+            self._resolved[key] = node.nodeid
+        return self.client.get_node(self._resolved[key])
+
+    async def get_namespace_index(self, uri):
+        if uri not in self._namespaces:
+            self._namespaces[uri] = await self.client.get_namespace_index(uri)
+        return self._namespaces[uri]
+
+    def _log_connected(self):
+        _logger.info(
+            "connected to %s (%s) in %.1f ms",
+            self.url,
+            self.security or "NoSecurity",
+            self.connect_time * 1000,
+        )
+
+
+class SessionPool:
+    """One shared SessionClient per (url, security) so callers reuse sessions"""
+
+    _sessions = {}
+
+    @staticmethod
+    async def get(url, security=""):
+        key = (url, security)
+        session = SessionPool._sessions.get(key)
+        if session is None:
+            session = SessionClient(url, security)
+            SessionPool._sessions[key] = session
+        if not session.connected:
+            await session.connect()
+        return session
+
+    @staticmethod
+    async def close_all():
+        sessions = list(SessionPool._sessions.values())
+        SessionPool._sessions.clear()
+        for session in sessions:
+            await session.disconnect()
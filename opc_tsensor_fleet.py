@@ -0,0 +1,429 @@
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import logging
+import random
+import time
+
+from asyncua import ua
+
+from opc_session import ensure_certificates, server_app_uri
+from opc_tsensor_ver2 import TempSensorServer
+from packed_array import PlainArrays, packed_variant
+
+_logger = logging.getLogger(__name__)
+
+# Fleet defaults
+HOST = "localhost"
+BASE_PORT = 4850
+ENDPOINT_TEMPLATE = "opc.tcp://{host}:{port}/freeopcua/temp_sensor{number}/"
+FLEET_SERVER_NAME = "Temperature_Sensor_Fleet"
+REPORT_INTERVAL = 10.0
+NOISE_PROFILES = ("gaussian", "uniform", "drift")
+
+
+class SensorConfig(object):
+    """Per-sensor simulation settings"""
+
+    def __init__(
+        self,
+        number,
+        rate=1 / 3,
+        array_size=100,
+        mu=25.0,
+        sigma=1.0,
+        noise="gaussian",
+        threshold_high=28.0,
+        threshold_low=22.0,
+        excursion_prob=0.0,
+        stall_prob=0.0,
+        stall_duration=5.0,
+        disconnect_prob=0.0,
+        disconnect_duration=5.0,
+    ):
+        if noise not in NOISE_PROFILES:
+            raise ValueError(f"unknown noise profile: {noise}")
+        if rate <= 0:
+            raise ValueError(f"update rate must be positive: {rate}")
+        self.number = number
+        self.rate = rate  # updates per second
+        self.array_size = array_size
+        self.mu = mu
+        self.sigma = sigma
+        self.noise = noise
+        self.threshold_high = threshold_high
+        self.threshold_low = threshold_low
+        self.excursion_prob = excursion_prob  # per update
+        self.stall_prob = stall_prob  # per update
+        self.stall_duration = stall_duration
+        self.disconnect_prob = disconnect_prob  # per update
+        self.disconnect_duration = disconnect_duration
+
+    @property
+    def name(self):
+        return f"temp_sensor_{self.number}"
+
+    @staticmethod
+    def from_dict(number, values):
+        return SensorConfig(number, **values)
+
+
+class SensorStats(object):
+    """Counters used to report the rate a sensor actually achieved"""
+
+    def __init__(self, name, target_rate):
+        self.name = name
+        self.target_rate = target_rate
+        self.updates = 0
+        self.excursions = 0
+        self.stalls = 0
+        self.disconnects = 0
+        self.started = time.monotonic()
+        self.stopped = None  # set when the sensor stops publishing
+
+    def achieved_rate(self):
+        stopped = time.monotonic() if self.stopped is None else self.stopped
+        elapsed = stopped - self.started
+        return self.updates / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "target_rate": self.target_rate,
+            "achieved_rate": self.achieved_rate(),
+            "updates": self.updates,
+            "excursions": self.excursions,
+            "stalls": self.stalls,
+            "disconnects": self.disconnects,
+        }
+
+
+class SimulatedSensor(object):
+    """One simulated temperature sensor publishing into a temp_sensor object"""
+
+    def __init__(
+        self,
+        config,
+        server,
+        data_node,
+        status_node,
+        own_server,
+        packed_node=None,
+        plain=None,
+    ):
+        self.config = config
+        self.server = server
+        self.data_node = data_node
+        self.packed_node = packed_node
+        self.plain = plain  # PlainArrays of server, required with packed_node
+        self.status_node = status_node
+        self.own_server = own_server  # only a dedicated server can be disconnected
+        self.stats = SensorStats(config.name, config.rate)
+        self.drift = 0.0
+
+    def generate_temperature(self):
+        config = self.config
+        if config.noise == "uniform":
+            half_width = config.sigma * 3**0.5
+            data = [
+                random.uniform(config.mu - half_width, config.mu + half_width)
+                for _ in range(config.array_size)
+            ]
+        elif config.noise == "drift":
+            self.drift += random.normalvariate(0, config.sigma / 10)
+            data = TempSensorServer.generate_temperature(
+                config.mu + self.drift, config.sigma, config.array_size
+            )
+        else:
+            data = TempSensorServer.generate_temperature(
+                config.mu, config.sigma, config.array_size
+            )
+        if random.random() < config.excursion_prob:
+            # push one sample past a threshold so the edge raises an alarm
+            if random.random() < 0.5:
+                data[random.randrange(len(data))] = config.threshold_high + config.sigma
+            else:
+                data[random.randrange(len(data))] = config.threshold_low - config.sigma
+            self.stats.excursions += 1
+        return data
+
+    async def inject_faults(self):
+        config = self.config
+        if random.random() < config.stall_prob:
+            _logger.info("%s: stalling for %ss", config.name, config.stall_duration)
+            self.stats.stalls += 1
+            await self.status_node.write_value("stalled")
+            await asyncio.sleep(config.stall_duration)
+        if random.random() < config.disconnect_prob:
+            _logger.info(
+                "%s: disconnecting for %ss", config.name, config.disconnect_duration
+            )
+            self.stats.disconnects += 1
+            await self.status_node.write_value("disconnected")
+            if self.own_server:
+                await self.server.bserver.stop()
+                await asyncio.sleep(config.disconnect_duration)
+                await self.server.bserver.start()
+            else:
+                await asyncio.sleep(config.disconnect_duration)
+
+    async def run(self, stop_at=None):
+        period = 1 / self.config.rate
+        self.stats.started = time.monotonic()
+        next_update = self.stats.started
+        try:
+            while stop_at is None or time.monotonic() < stop_at:
+                await self.inject_faults()
+                await self.status_node.write_value("running")
+                data = self.generate_temperature()
+                if self.packed_node is None:
+                    await self.data_node.write_value(
+                        ua.Variant(data, ua.VariantType.Double)
+                    )
+                else:
+                    await self.packed_node.write_value(packed_variant(data))
+                    await self.plain.update(self.data_node, data)
+                self.stats.updates += 1
+                # schedule against absolute deadlines so write time does not lower the rate
+                next_update = max(next_update + period, time.monotonic())
+                await asyncio.sleep(next_update - time.monotonic())
+        finally:
+            self.stats.stopped = time.monotonic()
+
+
+class SensorFleet(object):
+    """Runs many simulated sensors in one asyncio loop"""
+
+    @staticmethod
+    async def setup_server(endpoint, name):
+        server = await TempSensorServer.setup_server(endpoint, name)
+        idx = await TempSensorServer.create_namespace(server)
+        sensor_type = await TempSensorServer.create_sensor_type(server, idx)
+        return server, idx, sensor_type
+
+    @staticmethod
+    async def add_sensor(server, idx, sensor_type, config, own_server, plain):
+        (
+            _,
+            data_node,
+            status_node,
+            _,
+            _,
+            packed_node,
+        ) = await TempSensorServer.instantiate_sensor_node(
+            sensor_type, idx, config.name, config.threshold_high, config.threshold_low
+        )
+        if packed_node is not None:
+            plain.add(data_node)
+        return SimulatedSensor(
+            config, server, data_node, status_node, own_server, packed_node, plain
+        )
+
+    @staticmethod
+    def server_name(config, mode="port"):
+        return (
+            FLEET_SERVER_NAME
+            if mode == "object"
+            else f"Temperature_Sensor{config.number}"
+        )
+
+    @staticmethod
+    async def create_certificates(configs, mode):
+        names = {SensorFleet.server_name(config, mode) for config in configs}
+        for name in sorted(names):
+            await ensure_certificates(name, server_app_uri(name), server=True)
+
+    @staticmethod
+    async def build(configs, mode, host=HOST, base_port=BASE_PORT):
+        """Create the servers: one per sensor ("port") or one shared ("object")"""
+        servers, sensors = [], []
+        if mode == "object":
+            number = configs[0].number
+            server, idx, sensor_type = await SensorFleet.setup_server(
+                ENDPOINT_TEMPLATE.format(host=host, port=base_port, number=number),
+                FLEET_SERVER_NAME,
+            )
+            servers.append(server)
+            plain = PlainArrays(server)
+            for config in configs:
+                sensors.append(
+                    await SensorFleet.add_sensor(
+                        server, idx, sensor_type, config, False, plain
+                    )
+                )
+        else:
+            for config in configs:
+                server, idx, sensor_type = await SensorFleet.setup_server(
+                    ENDPOINT_TEMPLATE.format(
+                        host=host,
+                        port=base_port + config.number - 1,
+                        number=config.number,
+                    ),
+                    SensorFleet.server_name(config),
+                )
+                servers.append(server)
+                sensors.append(
+                    await SensorFleet.add_sensor(
+                        server, idx, sensor_type, config, True, PlainArrays(server)
+                    )
+                )
+        return servers, sensors
+
+    @staticmethod
+    async def report(sensors):
+        while True:
+            await asyncio.sleep(REPORT_INTERVAL)
+            SensorFleet.log_summary([sensor.stats.as_dict() for sensor in sensors])
+
+    @staticmethod
+    def log_summary(stats):
+        if not stats:
+            return
+        target = sum(s["target_rate"] for s in stats)
+        achieved = sum(s["achieved_rate"] for s in stats)
+        slowest = min(stats, key=lambda s: s["achieved_rate"] / s["target_rate"])
+        _logger.info(
+            "%d sensors: %.2f/%.2f updates/s achieved (%.1f%%), slowest %s at %.3f/%.3f",
+            len(stats),
+            achieved,
+            target,
+            100 * achieved / target,
+            slowest["name"],
+            slowest["achieved_rate"],
+            slowest["target_rate"],
+        )
+
+    @staticmethod
+    async def run(configs, mode="port", duration=None, host=HOST, base_port=BASE_PORT):
+        servers, sensors = await SensorFleet.build(configs, mode, host, base_port)
+        for server in servers:
+            await server.start()
+        _logger.info("started %d sensors on %d servers", len(sensors), len(servers))
+        stop_at = None if duration is None else time.monotonic() + duration
+        reporter = asyncio.create_task(SensorFleet.report(sensors))
+        try:
+            await asyncio.gather(*[sensor.run(stop_at) for sensor in sensors])
+            # taken before the servers stop, so shutdown time does not count
+            stats = [sensor.stats.as_dict() for sensor in sensors]
+        finally:
+            reporter.cancel()
+            for server in servers:
+                await server.stop()
+        return stats
+
+
+def sensor_endpoint(number, mode="port", processes=1, host=HOST, base_port=BASE_PORT):
+    """Endpoint serving sensor number in the layout run_fleet starts"""
+    if mode == "object":
+        # sensors are dealt round-robin to processes, each with one server
+        chunk = (number - 1) % max(processes, 1)
+        return ENDPOINT_TEMPLATE.format(
+            host=host, port=base_port + chunk, number=chunk + 1
+        )
+    return ENDPOINT_TEMPLATE.format(
+        host=host, port=base_port + number - 1, number=number
+    )
+
+
+def run_worker(configs, mode, duration, host, base_port):
+    """Process pool entry point: run a slice of the fleet in its own event loop"""
+    logging.basicConfig(level=logging.INFO)
+    return asyncio.run(SensorFleet.run(configs, mode, duration, host, base_port))
+
+
+def run_fleet(
+    configs, mode="port", processes=1, duration=None, host=HOST, base_port=BASE_PORT
+):
+    """Run the fleet, spreading sensors over a process pool when processes > 1"""
+    if processes <= 1:
+        stats = asyncio.run(SensorFleet.run(configs, mode, duration, host, base_port))
+    else:
+        if duration is None:
+            raise ValueError("a duration is required when running a process pool")
+        # generated here, once, so pool processes never write the same pair
+        asyncio.run(SensorFleet.create_certificates(configs, mode))
+        chunks = [configs[i::processes] for i in range(processes)]
+        chunks = [chunk for chunk in chunks if chunk]
+        with concurrent.futures.ProcessPoolExecutor(len(chunks)) as pool:
+            futures = [
+                # in object mode every process hosts its own server on its own port
+                (
+                    pool.submit(run_worker, chunk, mode, duration, host, base_port + i)
+                    if mode == "object"
+                    else pool.submit(run_worker, chunk, mode, duration, host, base_port)
+                )
+                for i, chunk in enumerate(chunks)
+            ]
+            stats = [s for future in futures for s in future.result()]
+    SensorFleet.log_summary(stats)
+    return stats
+
+
+def load_configs(args):
+    defaults = {
+        "rate": args.rate,
+        "array_size": args.array_size,
+        "noise": args.noise,
+        "excursion_prob": args.excursion_prob,
+        "stall_prob": args.stall_prob,
+        "disconnect_prob": args.disconnect_prob,
+    }
+    overrides = []
+    if args.config:
+        with open(args.config) as f:
+            overrides = json.load(f)
+    count = max(args.sensors, len(overrides))
+    configs = []
+    for number in range(1, count + 1):
+        values = dict(defaults)
+        if number <= len(overrides):
+            values.update(overrides[number - 1])
+        configs.append(SensorConfig.from_dict(number, values))
+    return configs
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Simulated temperature sensor fleet")
+    parser.add_argument("-n", "--sensors", type=int, default=10)
+    parser.add_argument(
+        "--mode",
+        choices=["port", "object"],
+        default="port",
+        help="one server per sensor, or one server with many sensor objects",
+    )
+    parser.add_argument("-p", "--processes", type=int, default=1)
+    parser.add_argument(
+        "-d", "--duration", type=float, default=None, help="seconds to run"
+    )
+    parser.add_argument("--base-port", type=int, default=BASE_PORT)
+    parser.add_argument("--rate", type=float, default=1 / 3, help="updates per second")
+    parser.add_argument("--array-size", type=int, default=100)
+    parser.add_argument("--noise", choices=NOISE_PROFILES, default="gaussian")
+    parser.add_argument("--excursion-prob", type=float, default=0.0)
+    parser.add_argument("--stall-prob", type=float, default=0.0)
+    parser.add_argument("--disconnect-prob", type=float, default=0.0)
+    parser.add_argument(
+        "--config", help="JSON list of per-sensor SensorConfig overrides"
+    )
+    parser.add_argument(
+        "--stats", help="write the final per-sensor stats to this JSON file"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("asyncua").setLevel(logging.WARNING)
+    args = parse_args()
+    stats = run_fleet(
+        load_configs(args),
+        args.mode,
+        args.processes,
+        args.duration,
+        HOST,
+        args.base_port,
+    )
+    if args.stats:
+        with open(args.stats, "w") as f:
+            json.dump(stats, f, indent=2)
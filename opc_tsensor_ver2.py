@@ -6,6 +6,9 @@ import random
 from asyncua import ua, Server
 from asyncua.common.xmlexporter import XmlExporter
 
+from opc_session import load_server_certificate
+from packed_array import PlainArrays, packed_variant
+
 # Configure logger
 logging.basicConfig(level=logging.INFO)
 _logger = logging.getLogger(__name__)
@@ -19,6 +22,7 @@ SECURITY_POLICIES = [
     ua.SecurityPolicyType.Basic256Sha256_Sign,
 ]
 URI = "http://sample.sensor2hmi.io"
+PACKED_ENCODING = True  # publish data as a packed ByteString (data_packed)
 
 
 class SubHandler(object):
@@ -39,12 +43,13 @@ class TempSensorServer(object):
         return [random.normalvariate(mu, sigma) for _ in range(n)]
 
     @staticmethod
-    async def setup_server():
+    async def setup_server(endpoint=SERVER_ENDPOINT, name=SERVER_NAME):
         server = Server()
         await server.init()
-        server.set_endpoint(SERVER_ENDPOINT)
-        server.set_server_name(SERVER_NAME)
+        server.set_endpoint(endpoint)
+        server.set_server_name(name)
         server.set_security_policy(SECURITY_POLICIES)
+        await load_server_certificate(server, name)
         return server
 
     @staticmethod
@@ -72,14 +77,33 @@ class TempSensorServer(object):
         return sensor_type
 
     @staticmethod
-    async def instantiate_sensor_node(sensor_type, idx):
-        temp_sensor_1 = await sensor_type.add_object(idx, "temp_sensor_1", sensor_type)
-        threshold_high_1 = await temp_sensor_1.add_property(idx, "threshold_high", 28.0)
-        threshold_low_1 = await temp_sensor_1.add_property(idx, "threshold_low", 22.0)
+    async def instantiate_sensor_node(
+        sensor_type, idx, name="temp_sensor_1", threshold_high=28.0, threshold_low=22.0
+    ):
+        temp_sensor_1 = await sensor_type.add_object(idx, name, sensor_type)
+        threshold_high_1 = await temp_sensor_1.add_property(
+            idx, "threshold_high", threshold_high
+        )
+        threshold_low_1 = await temp_sensor_1.add_property(
+            idx, "threshold_low", threshold_low
+        )
         data_1 = await temp_sensor_1.get_child(["2:data"])
         status_1 = await temp_sensor_1.get_child(["2:status"])
         await status_1.set_writable()
-        return temp_sensor_1, data_1, status_1, threshold_high_1, threshold_low_1
+        # added last so the NodeIds of the standard nodes stay the same
+        data_packed_1 = None
+        if PACKED_ENCODING:
+            data_packed_1 = await temp_sensor_1.add_variable(
+                idx, "data_packed", packed_variant([])
+            )
+        return (
+            temp_sensor_1,
+            data_1,
+            status_1,
+            threshold_high_1,
+            threshold_low_1,
+            data_packed_1,
+        )
 
     @staticmethod
     async def export_nodes_to_xml(server, nodes):
@@ -99,11 +123,16 @@ class TempSensorServer(object):
         await status_change_event.trigger(message=f"status changed: {new_status}")
 
     @staticmethod
-    async def update_temperature_data(data_node):
+    async def update_temperature_data(data_node, packed_node=None, plain=None):
         temp_data = await data_node.read_value()
         temp_data = copy.copy(temp_data)
         temp_data = TempSensorServer.generate_temperature()
-        await data_node.write_value(temp_data)
+        if packed_node is None:
+            await data_node.write_value(temp_data)
+        else:
+            # the plain array is only written for clients that read or monitor it
+            await packed_node.write_value(packed_variant(temp_data))
+            await plain.update(data_node, temp_data)
 
     @staticmethod
     async def main():
@@ -111,8 +140,13 @@ class TempSensorServer(object):
         idx = await TempSensorServer.create_namespace(server)
         sensor_type = await TempSensorServer.create_sensor_type(server, idx)
         nodes = await TempSensorServer.instantiate_sensor_node(sensor_type, idx)
-        await TempSensorServer.export_nodes_to_xml(server, nodes)
+        await TempSensorServer.export_nodes_to_xml(
+            server, [node for node in nodes if node is not None]
+        )
         status_change_event = await TempSensorServer.create_event(server)
+        plain = PlainArrays(server) if PACKED_ENCODING else None
+        if plain is not None:
+            plain.add(nodes[1])
 
         # create subscription
         handler = SubHandler()
@@ -125,7 +159,9 @@ class TempSensorServer(object):
                 await TempSensorServer.update_status(
                     nodes[2], status_change_event, "running"
                 )
-                await TempSensorServer.update_temperature_data(nodes[1])
+                await TempSensorServer.update_temperature_data(
+                    nodes[1], nodes[5], plain
+                )
                 await TempSensorServer.update_status(
                     nodes[2], status_change_event, "idle"
                 )
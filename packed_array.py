@@ -0,0 +1,128 @@
+import struct
+
+import numpy as np
+from asyncua import ua
+from asyncua.common.callback import CallbackType
+
+# Packed array layout (little endian):
+#   magic "PA", version, ndim, dtype string (e.g. "<f8", NUL padded to 4 bytes),
+#   ndim x uint32 shape, then the raw C-ordered array bytes
+PACKED_MAGIC = b"PA"
+PACKED_VERSION = 1
+PACKED_DTYPE = np.dtype("<f8")
+_DTYPE_SIZE = 4
+_HEADER = struct.Struct(f"<2sBB{_DTYPE_SIZE}s")
+_DIM = struct.Struct("<I")
+
+
+def pack_array(data, dtype=PACKED_DTYPE):
+    """Encode an array-like as a typed binary blob without per-element work"""
+    array = np.ascontiguousarray(data, dtype=dtype)
+    dtype_str = array.dtype.str.encode("ascii")
+    if len(dtype_str) > _DTYPE_SIZE:
+        raise ValueError(f"dtype {array.dtype.str} does not fit the packed header")
+    header = _HEADER.pack(PACKED_MAGIC, PACKED_VERSION, array.ndim, dtype_str)
+    shape = b"".join(_DIM.pack(dim) for dim in array.shape)
+    return header + shape + array.tobytes()
+
+
+def unpack_array(blob):
+    """Decode a blob made by pack_array into a read-only NumPy view of it.
+
+    Raises ValueError for anything that is not a complete packed array.
+    """
+    try:
+        magic, version, ndim, dtype = _HEADER.unpack_from(blob)
+        if magic != PACKED_MAGIC or version != PACKED_VERSION:
+            raise ValueError("not a packed array")
+        offset = _HEADER.size
+        shape = tuple(
+            _DIM.unpack_from(blob, offset + i * _DIM.size)[0] for i in range(ndim)
+        )
+        offset += ndim * _DIM.size
+        dtype = np.dtype(dtype.rstrip(b"\0").decode("ascii"))
+    except (struct.error, TypeError, UnicodeDecodeError) as exp:
+        raise ValueError(f"not a packed array: {exp}") from exp
+    if len(blob) - offset != dtype.itemsize * int(np.prod(shape)):
+        raise ValueError("packed array size does not match its shape")
+    return np.frombuffer(blob, dtype=dtype, offset=offset).reshape(shape)
+
+
+def packed_variant(data):
+    return ua.Variant(pack_array(data), ua.VariantType.ByteString)
+
+
+class PlainArrays:
+    """Keeps plain Double array twins of packed data, written only on demand.
+
+    A plain array boxes every sample, so a registered node is written on
+    update only while a client monitors it. Otherwise the latest samples are
+    held and written just before a client reads the node. Use one instance
+    per server: asyncua keeps a single listener per callback type.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self._nodes = {}  # nodeid -> plain node
+        self._watchers = {}  # nodeid -> {(subscription id, monitored item id)}
+        self._pending = {}  # nodeid -> samples not written yet
+        server.subscribe_server_callback(
+            CallbackType.ItemSubscriptionCreated, self._item_created
+        )
+        server.subscribe_server_callback(
+            CallbackType.ItemSubscriptionDeleted, self._item_deleted
+        )
+        server.subscribe_server_callback(CallbackType.PreRead, self._pre_read)
+
+    def add(self, node):
+        self._nodes[node.nodeid] = node
+        self._watchers[node.nodeid] = set()
+
+    async def update(self, node, samples):
+        if self.monitored(node.nodeid):
+            self._pending.pop(node.nodeid, None)
+            await PlainArrays.write(node, samples)
+        else:
+            self._pending[node.nodeid] = samples
+
+    def monitored(self, nodeid):
+        watchers = self._watchers[nodeid]
+        if watchers:
+            # deleting a subscription or closing a session fires no item callback
+            live = self.server.iserver.subscription_service.subscriptions
+            watchers.difference_update([w for w in watchers if w[0] not in live])
+        return bool(watchers)
+
+    @staticmethod
+    async def write(node, samples):
+        values = np.asarray(samples, dtype=np.float64).ravel().tolist()
+        await node.write_value(ua.Variant(values, ua.VariantType.Double))
+
+    async def _flush(self, nodeid):
+        samples = self._pending.pop(nodeid, None)
+        if samples is not None:
+            await PlainArrays.write(self._nodes[nodeid], samples)
+
+    async def _item_created(self, event, dispatcher):
+        params = event.request_params
+        for item, result in zip(params.ItemsToCreate, event.response_params):
+            nodeid = item.ItemToMonitor.NodeId
+            if nodeid in self._watchers and result.StatusCode.is_good():
+                self._watchers[nodeid].add(
+                    (params.SubscriptionId, result.MonitoredItemId)
+                )
+                await self._flush(nodeid)
+
+    def _item_deleted(self, event, dispatcher):
+        params = event.request_params
+        deleted = {(params.SubscriptionId, item) for item in params.MonitoredItemIds}
+        for watchers in self._watchers.values():
+            watchers -= deleted
+
+    async def _pre_read(self, event, dispatcher):
+        for read_id in event.request_params.NodesToRead:
+            if (
+                read_id.NodeId in self._pending
+                and read_id.AttributeId == ua.AttributeIds.Value
+            ):
+                await self._flush(read_id.NodeId)
@@ -1,4 +1,6 @@
+import hashlib
 import os
+import pickle
 import pandas as pd
 from openpyxl import Workbook
 from openpyxl.utils.dataframe import dataframe_to_rows
@@ -9,30 +11,50 @@ from scapy.layers.inet import TCP, IP
 class PacketAnalyzer:
     """Class for analyzing packets."""
 
-    def __init__(self, packets):
-        """Initialize the PacketAnalyzer."""
-        self.packets = packets
+    def __init__(self, packets, window_size=1, state=None):
+        """Initialize the PacketAnalyzer, optionally resuming from a saved state."""
+        self.packets = list(packets)
+        self.window_size = window_size  # Length of each analysis window in seconds
         self.seq_to_time = {}  # Mapping sequence numbers to their corresponding times
-        self.one_second_packets = []  # Storing packets within one second
+        self.window_packets = []  # Storing packets within one window
         self.packets_with_rtt = {}  # Mapping packets to their RTTs
         self.current_packet_index = 0  # Keeping track of current packet
+        self.rtt_start_index = 0  # First packet whose RTT is not known yet
+        if state is not None:
+            self.restore_state(state)
+
+    def restore_state(self, state):
+        """Prepend the pending window of a previous run and restore its flow state."""
+        pending = [pkt for pkt, _ in state["pending"]]
+        self.packets = pending + self.packets
+        self.packets_with_rtt = {index: rtt for index, (_, rtt) in enumerate(state["pending"])}
+        self.seq_to_time = dict(state["seq_to_time"])
+        self.rtt_start_index = len(pending)
+
+    def get_state(self):
+        """Return the flow state and the last (still open) window for a later resume."""
+        return {
+            "seq_to_time": dict(self.seq_to_time),
+            "pending": [(self.packets[index], self.packets_with_rtt.get(index)) for index in self.window_packets],
+        }
 
     def calculate_total_throughput(self):
         """Calculate total throughput from packets."""
-        return sum(len(self.packets[packet_index]) for packet_index in self.one_second_packets)
+        return sum(len(self.packets[packet_index]) for packet_index in self.window_packets)
 
     def calculate_average_rtt(self):
         """Calculate the average RTT."""
         rtt_values = [
         self.packets_with_rtt[pkt_index]
-        for pkt_index in self.one_second_packets
+        for pkt_index in self.window_packets
         if pkt_index in self.packets_with_rtt and self.packets_with_rtt[pkt_index] is not None
         ]
         return sum(rtt_values) / len(rtt_values) if rtt_values else None
 
     def calculate_rtt(self):
         """Calculate RTT for packets and update seq_to_time and packets_with_rtt."""
-        for index, pkt in enumerate(self.packets):
+        for index in range(self.rtt_start_index, len(self.packets)):
+            pkt = self.packets[index]
             if IP in pkt and TCP in pkt:
                 seq = pkt[TCP].seq
                 ack = pkt[TCP].ack
@@ -40,14 +62,15 @@ class PacketAnalyzer:
                 if pkt[TCP].flags in ["PA", "P"]:
                     self.seq_to_time[seq + len(pkt[TCP].load)] = pkt.time
                 self.packets_with_rtt[index] = rtt
+        self.rtt_start_index = len(self.packets)
 
     def calculate_retransmission_rate(self):
         """Calculate retransmission rate for packets."""
-        total_packet_count = len(self.one_second_packets)
+        total_packet_count = len(self.window_packets)
         retransmission_count = 0
         expected_seq = {}
 
-        for packet_index in self.one_second_packets:
+        for packet_index in self.window_packets:
             packet = self.packets[packet_index]
             if TCP not in packet:
                 continue
@@ -69,10 +92,10 @@ class PacketAnalyzer:
         self.calculate_rtt()
         while self.current_packet_index < len(self.packets):
             start_time = self.packets[self.current_packet_index].time
-            self.one_second_packets = []
+            self.window_packets = []
 
-            while self.current_packet_index < len(self.packets) and self.packets[self.current_packet_index].time < start_time + 1:
-                self.one_second_packets.append(self.current_packet_index)
+            while self.current_packet_index < len(self.packets) and self.packets[self.current_packet_index].time < start_time + self.window_size:
+                self.window_packets.append(self.current_packet_index)
                 self.current_packet_index += 1
 
             yield {
@@ -82,22 +105,154 @@ class PacketAnalyzer:
             }
 
 
-def analyze_pcap_files():
-    """Analyze .pcapng files in the current directory and write results to a .xlsx file."""
+class AnalysisCache:
+    """Persistent per-file cache of analysis results and resumable analyzer state."""
+
+    VERSION = 2
+    HASH_CHUNK_SIZE = 1 << 20
+
+    def __init__(self, path):
+        """Load the cache stored at path, starting empty if it is missing or stale."""
+        self.path = path
+        self.entries = {}
+        if os.path.isfile(path):
+            try:
+                with open(path, "rb") as f:
+                    data = pickle.load(f)
+                if data.get("version") == self.VERSION:
+                    self.entries = data["entries"]
+            except Exception:
+                # Unreadable, truncated or written by incompatible library versions
+                self.entries = {}
+
+    def save(self):
+        """Atomically write the cache back to disk."""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"version": self.VERSION, "entries": self.entries}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def file_identity(filename):
+        """Return the (device, inode, size, mtime) tuple identifying a file on disk."""
+        st = os.stat(filename)
+        return st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns
+
+    @classmethod
+    def content_hash(cls, filename, size):
+        """Return the SHA-256 digest of the first size bytes of a file."""
+        digest = hashlib.sha256()
+        remaining = size
+        with open(filename, "rb") as f:
+            while remaining > 0:
+                chunk = f.read(min(cls.HASH_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                remaining -= len(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def key(filename, params):
+        """Return the cache key of a file analyzed with the given parameters."""
+        return os.path.abspath(filename), frozenset(params.items())
+
+    def lookup(self, filename, params):
+        """Classify a file as ("unchanged", entry), ("appended", entry) or ("new", None)."""
+        entry = self.entries.get(self.key(filename, params))
+        if entry is None:
+            return "new", None
+        identity = self.file_identity(filename)
+        if identity == entry["identity"]:
+            return "unchanged", entry
+        size = identity[2]
+        if size < entry["size"] or self.content_hash(filename, entry["size"]) != entry["content_hash"]:
+            return "new", None
+        if size == entry["size"]:
+            # Touched but not modified: refresh the identity so the next run takes the fast path
+            entry["identity"] = identity
+            return "unchanged", entry
+        return "appended", entry
+
+    def store(self, filename, params, identity, content_hash, reader_state, analyzer_state, rows):
+        """Record the results and resume point of a file."""
+        self.entries[self.key(filename, params)] = {
+            "identity": identity,
+            "size": identity[2],
+            "content_hash": content_hash,
+            "reader_state": reader_state,
+            "analyzer_state": analyzer_state,
+            "rows": rows,
+        }
+
+
+def read_packets(filename, reader_state=None):
+    """Read packets from a capture, optionally resuming at a saved reader offset.
+
+    Returns the packets and the reader state (offset and pcapng interfaces)
+    right after the last complete packet, so a later call only parses what
+    has been appended since.
+    """
+    packets = []
+    with PcapReader(filename) as reader:
+        if reader_state is not None:
+            if hasattr(reader, "interfaces"):
+                reader.interfaces = list(reader_state["interfaces"])
+            reader.f.seek(reader_state["offset"])
+        state = {"offset": reader.f.tell(), "interfaces": list(getattr(reader, "interfaces", []))}
+        for pkt in reader:
+            packets.append(pkt)
+            state = {"offset": reader.f.tell(), "interfaces": list(getattr(reader, "interfaces", []))}
+    return packets, state
+
+
+def analyze_pcap_file(pcapng_file, cache, window_size=1):
+    """Analyze one capture, reusing cached results and resuming appended files."""
+    params = {"window_size": window_size}
+    status, entry = cache.lookup(pcapng_file, params)
+    if status == "unchanged":
+        return pd.DataFrame(entry["rows"]), False
+
+    # Snapshot identity and hash before reading, so bytes appended meanwhile are picked up next run
+    identity = AnalysisCache.file_identity(pcapng_file)
+    content_hash = AnalysisCache.content_hash(pcapng_file, identity[2])
+    if status == "appended":
+        packets, reader_state = read_packets(pcapng_file, entry["reader_state"])
+        packet_analyzer = PacketAnalyzer(packets, window_size, entry["analyzer_state"])
+        rows = entry["rows"][:-1] if entry["analyzer_state"]["pending"] else list(entry["rows"])
+    else:
+        packets, reader_state = read_packets(pcapng_file)
+        packet_analyzer = PacketAnalyzer(packets, window_size)
+        rows = []
+
+    rows.extend(packet_analyzer.process_packets())
+    cache.store(
+        pcapng_file, params, identity, content_hash, reader_state, packet_analyzer.get_state(), rows
+    )
+    return pd.DataFrame(rows), True
+
+
+def analyze_pcap_files(window_size=1, cache_file=".pcap_analysis_cache.pkl"):
+    """Analyze .pcapng files in the current directory and write results to a .xlsx file.
+
+    Results are cached in cache_file: unchanged files are skipped and files
+    that were only appended to are analyzed from where the last run stopped.
+    """
     pcapng_files = [f for f in os.listdir(".") if os.path.isfile(f) and f.endswith(".pcapng")]
+    cache = AnalysisCache(cache_file)
 
     wb = Workbook()
 
     for pcapng_file in pcapng_files:
-        packets = rdpcap(pcapng_file)
-        packet_analyzer = PacketAnalyzer(packets)
-        df = pd.DataFrame(packet_analyzer.process_packets())
-        df.to_csv(pcapng_file + ".csv", index=False)
+        df, updated = analyze_pcap_file(pcapng_file, cache, window_size)
+        if updated or not os.path.isfile(pcapng_file + ".csv"):
+            df.to_csv(pcapng_file + ".csv", index=False)
         ws = wb.create_sheet(pcapng_file)
 
         for r in dataframe_to_rows(df, index=False, header=True):
             ws.append(r)
 
+    cache.save()
     wb.save("Compilation.xlsx")
 
 
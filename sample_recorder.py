@@ -0,0 +1,205 @@
+import glob
+import logging
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+_logger = logging.getLogger(__name__)
+
+# Recorder defaults
+RECORD_DIR = "recordings"
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+SEGMENT_MAX_SECONDS = 3600.0
+FLUSH_SAMPLES = 64 * 1024  # buffered samples that trigger a flush
+FLUSH_INTERVAL = 1.0  # seconds
+
+# Each segment is a pair of append-only files:
+#   <monitor>_<seq>.f64  raw float64 samples, all records back to back
+#   <monitor>_<seq>.idx  one INDEX_DTYPE entry per record pointing into .f64
+SAMPLE_DTYPE = np.dtype("<f8")
+INDEX_DTYPE = np.dtype([("timestamp", "<f8"), ("offset", "<i8"), ("count", "<i8")])
+
+
+class SampleRecorder:
+    """Buffers sample arrays in memory and writes them from a background thread.
+
+    record() only appends to a list, so it is safe to call from the asyncua
+    event loop; disk I/O happens in the writer thread in large batches. The
+    writer also wakes every flush_interval, so a quiet monitor's last records
+    reach disk without waiting for the next record() call.
+    """
+
+    def __init__(
+        self,
+        monitor,
+        directory=RECORD_DIR,
+        segment_max_bytes=SEGMENT_MAX_BYTES,
+        segment_max_seconds=SEGMENT_MAX_SECONDS,
+        flush_samples=FLUSH_SAMPLES,
+        flush_interval=FLUSH_INTERVAL,
+    ):
+        self.monitor = monitor
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_seconds = segment_max_seconds
+        self.flush_samples = flush_samples
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._buffered_samples = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._batches = queue.Queue()
+        self._segment = None  # [data file, index file, bytes written, opened at]
+        self._sequence = self._last_sequence()
+        os.makedirs(directory, exist_ok=True)
+        self._writer = threading.Thread(
+            target=self._write_loop, name=f"recorder-{monitor}", daemon=True
+        )
+        self._writer.start()
+
+    def record(self, timestamp, samples):
+        samples = np.array(samples, dtype=SAMPLE_DTYPE).ravel()
+        with self._lock:
+            self._buffer.append((timestamp, samples))
+            self._buffered_samples += samples.size
+            if (
+                self._buffered_samples >= self.flush_samples
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            ):
+                self._take_buffer()
+
+    def flush(self):
+        """Hand the buffered records to the writer thread"""
+        with self._lock:
+            self._take_buffer()
+
+    def _take_buffer(self):
+        if self._buffer:
+            self._batches.put(self._buffer)
+            self._buffer = []
+            self._buffered_samples = 0
+        self._last_flush = time.monotonic()
+
+    def _flush_stale(self):
+        """Flush from the writer thread once the buffer has waited too long"""
+        with self._lock:
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                self._take_buffer()
+
+    def close(self):
+        self.flush()
+        self._batches.put(None)
+        self._writer.join()
+
+    def _last_sequence(self):
+        segments = RecordingReader.segment_paths(self.directory, self.monitor)
+        if not segments:
+            return 0
+        return int(segments[-1].rsplit("_", 1)[1]) + 1
+
+    def _open_segment(self):
+        base = os.path.join(self.directory, f"{self.monitor}_{self._sequence:06d}")
+        self._sequence += 1
+        self._segment = [
+            open(base + ".f64", "ab"),
+            open(base + ".idx", "ab"),
+            0,
+            time.monotonic(),
+        ]
+        _logger.info("recording %s to %s", self.monitor, base)
+
+    def _close_segment(self):
+        if self._segment is not None:
+            self._segment[0].close()
+            self._segment[1].close()
+            self._segment = None
+
+    def _write_batch(self, batch):
+        if self._segment is not None and (
+            self._segment[2] >= self.segment_max_bytes
+            or time.monotonic() - self._segment[3] >= self.segment_max_seconds
+        ):
+            self._close_segment()
+        if self._segment is None:
+            self._open_segment()
+        data_file, index_file, written, _ = self._segment
+        index = np.empty(len(batch), dtype=INDEX_DTYPE)
+        offset = written // SAMPLE_DTYPE.itemsize
+        for i, (timestamp, samples) in enumerate(batch):
+            index[i] = (timestamp, offset, samples.size)
+            offset += samples.size
+        data = np.concatenate([samples for _, samples in batch])
+        # data before index, so an index entry never points past written data
+        data_file.write(data.tobytes())
+        data_file.flush()
+        index_file.write(index.tobytes())
+        index_file.flush()
+        self._segment[2] = written + data.nbytes
+
+    def _write_loop(self):
+        while True:
+            try:
+                batch = self._batches.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._flush_stale()
+                continue
+            if batch is None:
+                break
+            try:
+                self._write_batch(batch)
+            except OSError:
+                _logger.exception(
+                    "failed to record %d %s records", len(batch), self.monitor
+                )
+        self._close_segment()
+
+
+class RecordingReader:
+    """Reads recorded segments through memory maps"""
+
+    def __init__(self, monitor, directory=RECORD_DIR):
+        self.monitor = monitor
+        self.directory = directory
+
+    @staticmethod
+    def segment_paths(directory, monitor):
+        """Segment base paths (without extension), oldest first"""
+        paths = glob.glob(os.path.join(directory, f"{monitor}_*.idx"))
+        return sorted(path[: -len(".idx")] for path in paths)
+
+    def segments(self):
+        return RecordingReader.segment_paths(self.directory, self.monitor)
+
+    @staticmethod
+    def open_segment(base):
+        """Return (index, data) memory maps of one segment"""
+        index_count = os.path.getsize(base + ".idx") // INDEX_DTYPE.itemsize
+        data_count = os.path.getsize(base + ".f64") // SAMPLE_DTYPE.itemsize
+        # a segment still being written may end with a partial record
+        index = (
+            np.memmap(base + ".idx", dtype=INDEX_DTYPE, mode="r", shape=(index_count,))
+            if index_count
+            else np.empty(0, dtype=INDEX_DTYPE)
+        )
+        data = (
+            np.memmap(base + ".f64", dtype=SAMPLE_DTYPE, mode="r", shape=(data_count,))
+            if data_count
+            else np.empty(0, dtype=SAMPLE_DTYPE)
+        )
+        return index, data
+
+    def records(self, start=None, end=None):
+        """Yield (timestamp, samples) with start <= timestamp < end"""
+        for base in self.segments():
+            index, data = RecordingReader.open_segment(base)
+            complete = index["offset"] + index["count"] <= data.size
+            selected = complete.copy()
+            if start is not None:
+                selected &= index["timestamp"] >= start
+            if end is not None:
+                selected &= index["timestamp"] < end
+            for timestamp, offset, count in index[selected]:
+                yield float(timestamp), data[offset : offset + count]